@@ -0,0 +1,137 @@
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src import CustomerServiceAgent
+from src.conversation_journal import ConversationJournal
+from src.models import ConversationContext, CustomerPersona, PersonaType, EscalationLevel
+
+SAMPLE_MESSAGES = [
+    "My API integration keeps failing with a 401 error on the auth endpoint",
+    "What is the expected ROI for an enterprise rollout across five teams?",
+    "This is not working again and I am really frustrated, please help now",
+    "How do I reset my password?"
+]
+
+def make_turn(customer_id: str, contexts: dict) -> tuple:
+    """Build a synthetic turn shaped like the ones CustomerServiceAgent produces"""
+    context = contexts.get(customer_id) or ConversationContext(
+        customer_id=customer_id,
+        messages=[],
+        detected_persona=None,
+        escalation_level=EscalationLevel.NONE,
+        technical_complexity=1,
+        sentiment_score=0.0
+    )
+    message = random.choice(SAMPLE_MESSAGES)
+    response = "Thanks for reaching out. " + message[::-1]
+    sentiment = random.uniform(-1.0, 1.0)
+    context.detected_persona = CustomerPersona(
+        persona_type=random.choice(list(PersonaType)),
+        confidence=random.random(),
+        characteristics={
+            'sentiment_score': sentiment,
+            'technical_score': random.random(),
+            'business_score': random.random(),
+            'frustration_score': random.random(),
+            'writing_style': {'technical_style': 0.1, 'formal_style': 0.0, 'avg_sentence_length': np.float64(9.5)}
+        }
+    )
+    context.sentiment_score = sentiment
+    context.technical_complexity = random.randint(1, 5)
+    context.escalation_level = random.choice(list(EscalationLevel))
+    context.messages.append({'role': 'customer', 'content': message})
+    context.messages.append({'role': 'agent', 'content': response})
+    contexts[customer_id] = context
+    return context, message, response
+
+def percentiles(samples: list) -> str:
+    p50, p99, p999 = np.percentile(samples, [50, 99, 99.9]) * 1e6
+    return f"p50={p50:.1f}us p99={p99:.1f}us p99.9={p999:.1f}us max={max(samples) * 1e6:.1f}us"
+
+def report_growth(samples: list, windows: int):
+    """Print tail latency per window so any growth with accumulated history shows up"""
+    size = max(1, len(samples) // windows)
+    for start in range(0, len(samples), size):
+        window = samples[start:start + size]
+        p999 = np.percentile(window, 99.9) * 1e6
+        print(f"  turns {start + 1}-{start + len(window)}: p99.9={p999:.1f}us max={max(window) * 1e6:.1f}us")
+
+def time_agent_turns(agent: CustomerServiceAgent, turns: int, customers: int) -> list:
+    """Time process_message end to end for a fixed, repeatable message stream"""
+    random.seed(0)
+    agent.conversation_contexts = {}
+    samples = []
+    for i in range(turns):
+        message = random.choice(SAMPLE_MESSAGES)
+        start = time.perf_counter()
+        agent.process_message(f"cust_{i % customers}", message)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_agent(turns: int, customers: int, snapshot_every: int):
+    """Compare process_message latency with and without the journal"""
+    agent = CustomerServiceAgent(journal_dir=None)
+    time_agent_turns(agent, 20, customers)  # warm up the models
+
+    baseline = time_agent_turns(agent, turns, customers)
+    print(f"process_message without journal ({turns} turns): {percentiles(baseline)}")
+
+    journal_dir = tempfile.mkdtemp(prefix="journal-bench-")
+    try:
+        agent.journal = ConversationJournal(journal_dir, snapshot_every=snapshot_every)
+        agent.journal.recover()
+        journaled = time_agent_turns(agent, turns, customers)
+        agent.close()
+        print(f"process_message with journal    ({turns} turns): {percentiles(journaled)}")
+        delta = (np.percentile(journaled, 99) - np.percentile(baseline, 99)) * 1e6
+        print(f"p99 difference: {delta:+.1f}us")
+    finally:
+        shutil.rmtree(journal_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure conversation journal write overhead and recovery time")
+    parser.add_argument('--turns', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--windows', type=int, default=5)
+    parser.add_argument('--snapshot-every', type=int, default=1000)
+    parser.add_argument('--agent', action='store_true',
+                        help="Also compare full process_message latency with and without the journal (loads the models)")
+    parser.add_argument('--agent-turns', type=int, default=2000)
+    args = parser.parse_args()
+
+    journal_dir = tempfile.mkdtemp(prefix="journal-bench-")
+    try:
+        journal = ConversationJournal(journal_dir, snapshot_every=args.snapshot_every)
+        contexts = journal.recover()
+
+        write_times = []
+        for i in range(args.turns):
+            context, message, response = make_turn(f"cust_{i % args.customers}", contexts)
+            start = time.perf_counter()
+            journal.record_turn(context, message, response)
+            journal.maybe_snapshot()
+            write_times.append(time.perf_counter() - start)
+        journal.close()
+        print(f"Write overhead per turn ({args.turns} turns): {percentiles(write_times)}")
+        report_growth(write_times, args.windows)
+
+        start = time.perf_counter()
+        journal = ConversationJournal(journal_dir)
+        recovered = journal.recover()
+        elapsed = time.perf_counter() - start
+        journal.close()
+        assert len(recovered) == len(contexts)
+        print(f"Recovery from snapshot + tail ({len(recovered)} conversations): {elapsed * 1000:.1f}ms")
+    finally:
+        shutil.rmtree(journal_dir)
+
+    if args.agent:
+        bench_agent(args.agent_turns, args.customers, args.snapshot_every)
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,8 @@ def main():
         except Exception as e:
             print(f"Error processing message: {e}")
             continue
+    
+    agent.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,16 +1,21 @@
+from dataclasses import replace
+from typing import Dict, List, Optional
 from .persona_detector import PersonaDetector
 from .knowledge_base import KnowledgeBase
 from .response_generator import ResponseGenerator
 from .escalation_manager import EscalationManager
+from .conversation_journal import ConversationJournal
 from .models import ConversationContext, CustomerPersona
 
 class CustomerServiceAgent:
-    def __init__(self):
+    def __init__(self, journal_dir: Optional[str] = "data/journal"):
         self.persona_detector = PersonaDetector()
         self.knowledge_base = KnowledgeBase()
         self.response_generator = ResponseGenerator()
         self.escalation_manager = EscalationManager()
-        self.conversation_contexts = {}
+        # journal_dir=None keeps conversations in memory only
+        self.journal = ConversationJournal(journal_dir) if journal_dir else None
+        self.conversation_contexts = self.journal.recover() if self.journal else {}
     
     def process_message(self, customer_id: str, message: str) -> Dict:
         """Process customer message and return appropriate response"""
@@ -27,6 +32,8 @@ class CustomerServiceAgent:
             technical_complexity=1,
             sentiment_score=0.0
         ))
+        # Work on a copy so a failed journal write leaves the stored conversation untouched
+        context = replace(context, messages=list(context.messages))
         
         # Add new message to context
         context.messages.append({'role': 'customer', 'content': message})
@@ -76,9 +83,21 @@ class CustomerServiceAgent:
             
             context.escalation_level = escalation_result['level']
         
-        # Update context
         context.messages.append({'role': 'agent', 'content': response})
+        
+        # Persist the turn before keeping it, so memory never holds a turn the journal lost
+        if self.journal:
+            self.journal.record_turn(
+                context,
+                message,
+                response,
+                escalation_result['reason'] if escalation_result['needs_escalation'] else None
+            )
+        
+        # Update context
         self.conversation_contexts[customer_id] = context
+        if self.journal:
+            self.journal.maybe_snapshot()
         
         return {
             'response': response,
@@ -95,4 +114,9 @@ class CustomerServiceAgent:
     def get_conversation_history(self, customer_id: str) -> List[Dict]:
         """Get conversation history for customer"""
         context = self.conversation_contexts.get(customer_id)
-        return context.messages if context else []
\ No newline at end of file
+        return context.messages if context else []
+    
+    def close(self):
+        """Flush the conversation journal to disk"""
+        if self.journal:
+            self.journal.close()
\ No newline at end of file
@@ -0,0 +1,434 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import queue
+import zlib
+from typing import Dict, List, Optional, Any, Tuple
+from enum import Enum
+
+from .models import ConversationContext, CustomerPersona, PersonaType, EscalationLevel
+
+SNAPSHOT_FILE = "snapshot.json"
+CONVERSATIONS_DIR = "conversations"
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".jsonl"
+
+class ConversationJournal:
+    """Append-only write-ahead journal for conversation state.
+
+    Every turn is appended as one checksummed JSON line and flushed to the OS right
+    away, so a process crash loses nothing. fsync is group-committed by a
+    background thread, so a power loss can drop at most ``commit_interval``
+    seconds of turns.
+
+    Every ``snapshot_every`` turns the journal rotates to a new segment and
+    the background thread checkpoints the retired records. It appends them,
+    already encoded, to one log per conversation under ``conversations/``.
+    It then records the last checkpointed sequence number in
+    ``snapshot.json`` and deletes the segments that are now covered. A
+    checkpoint only writes the turns since the previous one, so its cost
+    does not grow with the total history. Recovery replays the conversation
+    logs and then the remaining segments.
+    """
+
+    def __init__(self, journal_dir: str = "data/journal", commit_interval: float = 0.05,
+                 group_commit_size: int = 64, snapshot_every: int = 1000):
+        self.journal_dir = journal_dir
+        self.commit_interval = commit_interval
+        self.group_commit_size = group_commit_size
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()  # guards the active segment, sequence and record buffer
+        self._commit_event = threading.Event()
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._error: Optional[Exception] = None
+
+        self._segment = None
+        self._next_seq = 1
+        self._pending = 0
+        self._dir_dirty = False  # a new segment's directory entry is not yet durable
+        self._since_snapshot = 0
+        # (customer_id, encoded line) for every record written since the last rotation
+        self._unsnapshotted: List[Tuple[str, str]] = []
+
+        self._conversations_dir = os.path.join(self.journal_dir, CONVERSATIONS_DIR)
+        os.makedirs(self._conversations_dir, exist_ok=True)
+
+    def recover(self) -> Dict[str, ConversationContext]:
+        """Rebuild conversation contexts from the checkpointed logs plus the journal tail"""
+        contexts: Dict[str, ConversationContext] = {}
+        applied: Dict[str, int] = {}  # highest checkpointed seq per conversation
+        last_seq = 0
+
+        snapshot_path = os.path.join(self.journal_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r') as f:
+                last_seq = json.load(f)['last_seq']
+        max_seq = last_seq
+
+        changed = False
+        for path in self._conversation_paths():
+            good_offset = 0
+            damaged = False
+            with open(path, 'rb') as f:
+                for line in f:
+                    record = _decode_record(line)
+                    if record is None:
+                        damaged = True
+                        break
+                    good_offset += len(line)
+                    _apply_record(contexts, record)
+                    applied[record['customer_id']] = record['seq']
+                    max_seq = max(max_seq, record['seq'])
+            if damaged:
+                # An interrupted checkpoint; its records are still in the segments
+                _truncate_damaged(path, good_offset)
+                changed = True
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+                changed = True
+        if changed:
+            _fsync_dir(self._conversations_dir)
+
+        replayed = 0
+        torn = False
+        changed = False
+        for path in self._segment_paths():
+            if torn:
+                # Records after a gap cannot be applied consistently; keep them for inspection
+                os.replace(path, path + ".corrupt")
+                changed = True
+                continue
+            good_offset = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    record = _decode_record(line)
+                    if record is None:
+                        # Torn or damaged record; nothing after it can be trusted
+                        torn = True
+                        break
+                    good_offset += len(line)
+                    customer_id = record['customer_id']
+                    # Checkpoints interrupted before snapshot.json was updated leave duplicates
+                    if record['seq'] <= last_seq or record['seq'] <= applied.get(customer_id, 0):
+                        continue
+                    _apply_record(contexts, record)
+                    self._unsnapshotted.append((customer_id, line.decode('utf-8')))
+                    max_seq = max(max_seq, record['seq'])
+                    replayed += 1
+            if torn:
+                _truncate_damaged(path, good_offset)
+                changed = True
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+                changed = True
+        if changed:
+            _fsync_dir(self.journal_dir)
+
+        self._next_seq = max_seq + 1
+        if replayed:
+            # Checkpoint the replayed tail so the next start is fast
+            self.snapshot()
+        else:
+            self._open_segment()
+        self._start_flusher()
+        return contexts
+
+    def record_turn(self, context: ConversationContext, message: str, response: str,
+                    escalation_reason: Optional[str] = None):
+        """Append one conversation turn to the journal
+
+        Raises RuntimeError, without writing the turn, once the journal has
+        failed. A failed write or fsync cannot be retried safely, so every
+        later call raises as well.
+        """
+        persona = context.detected_persona
+        record = {
+            'customer_id': context.customer_id,
+            'message': message,
+            'response': response,
+            'persona': _persona_to_dict(persona),
+            'escalation_level': _enum_value(context.escalation_level),
+            'escalation_reason': escalation_reason,
+            'technical_complexity': context.technical_complexity,
+            'sentiment_score': context.sentiment_score
+        }
+
+        with self._lock:
+            self._raise_if_failed()
+            if self._segment is None:
+                raise RuntimeError("Journal is not open; call recover() first")
+            record['seq'] = self._next_seq
+            self._next_seq += 1
+            line = _encode_record(record)
+            try:
+                self._segment.write(line)
+                self._segment.flush()
+            except OSError as error:
+                # A partial line may be on disk; appending after it would corrupt the segment
+                self._error = error
+                self._raise_if_failed()
+            self._unsnapshotted.append((context.customer_id, line))
+            self._pending += 1
+            self._since_snapshot += 1
+            if self._pending >= self.group_commit_size:
+                self._commit_event.set()
+
+    def maybe_snapshot(self):
+        """Take a snapshot once enough turns have been journaled since the last one"""
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Rotate the journal and checkpoint the retired records in the background
+
+        The caller only opens the next segment and swaps the record buffer.
+        Writing the conversation logs and fsync run on the flusher thread.
+        """
+        with self._lock:
+            retired = self._segment
+            if retired is not None and retired.tell() == 0:
+                # Nothing written since the last rotation; keep the empty segment
+                retired = None
+            else:
+                # Opened first, so a failure here leaves the buffer and segment untouched
+                self._open_segment()
+            # Taken together so the checkpoint holds exactly the records up to last_seq
+            last_seq = self._next_seq - 1
+            records, self._unsnapshotted = self._unsnapshotted, []
+            self._since_snapshot = 0
+        self._jobs.put((last_seq, records, retired))
+        self._commit_event.set()
+
+    def close(self):
+        """Commit outstanding writes and stop the background thread"""
+        if self._flusher is None:
+            return
+        self._closed.set()
+        self._commit_event.set()
+        self._flusher.join()
+        self._flusher = None
+        with self._lock:
+            self._segment.close()
+            self._segment = None
+        self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        """Surface a write or fsync failure on the caller's thread"""
+        if self._error is not None:
+            raise RuntimeError(f"Conversation journal failed: {self._error}") from self._error
+
+    def _segment_paths(self) -> List[str]:
+        """List journal segments ordered by their first sequence number"""
+        names = sorted(
+            name for name in os.listdir(self.journal_dir)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.journal_dir, name) for name in names]
+
+    def _conversation_paths(self) -> List[str]:
+        return [
+            os.path.join(self._conversations_dir, name)
+            for name in sorted(os.listdir(self._conversations_dir))
+            if name.endswith(SEGMENT_SUFFIX)
+        ]
+
+    def _conversation_path(self, customer_id: str) -> str:
+        # Hashed so any customer id maps to a safe file name
+        name = hashlib.sha1(customer_id.encode('utf-8')).hexdigest()
+        return os.path.join(self._conversations_dir, name + SEGMENT_SUFFIX)
+
+    def _open_segment(self):
+        """Start a new segment beginning at the next sequence number"""
+        name = f"{SEGMENT_PREFIX}{self._next_seq:020d}{SEGMENT_SUFFIX}"
+        # 'x' guarantees a fresh file; recovery removes empty and damaged segments first
+        self._segment = open(os.path.join(self.journal_dir, name), 'x')
+        self._pending = 0
+        self._dir_dirty = True
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._closed.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="conversation-journal", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """Group-commit pending writes and process snapshot jobs"""
+        while True:
+            self._commit_event.wait(self.commit_interval)
+            self._commit_event.clear()
+            try:
+                # Retired segments are synced before the active one to keep write order
+                while not self._jobs.empty():
+                    self._write_snapshot(*self._jobs.get())
+                self._commit()
+            except Exception as error:
+                # After a failed fsync the kernel may have dropped the dirty pages, so a
+                # later fsync could succeed without the data; stop and fail the journal
+                self._error = error
+                return
+            if self._closed.is_set():
+                return
+
+    def _commit(self):
+        # A rotated-out segment is only closed by this thread, so its fd stays valid here
+        with self._lock:
+            pending, sync_dir = self._pending, self._dir_dirty
+            if not pending and not sync_dir:
+                return
+            self._pending = 0
+            self._dir_dirty = False
+            fd = self._segment.fileno()
+        if pending:
+            os.fsync(fd)
+        if sync_dir:
+            # Without this a power loss can drop the whole segment file, synced contents and all
+            _fsync_dir(self.journal_dir)
+
+    def _write_snapshot(self, last_seq: int, records: List[Tuple[str, str]], retired):
+        """Append retired records to their conversation logs, then drop the covered segments
+
+        Only the records since the previous checkpoint are written, as the
+        lines already encoded by record_turn(). If any step fails the journal
+        is marked failed. The covered segments are kept, so recovery still
+        replays them.
+        """
+        if retired is not None:
+            try:
+                retired.flush()
+                os.fsync(retired.fileno())
+            finally:
+                retired.close()
+            _fsync_dir(self.journal_dir)
+
+        lines_by_customer: Dict[str, List[str]] = {}
+        for customer_id, line in records:
+            lines_by_customer.setdefault(customer_id, []).append(line)
+        for customer_id, lines in lines_by_customer.items():
+            with open(self._conversation_path(customer_id), 'a') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            # Hand the GIL back between files so request threads are not held up
+            time.sleep(0)
+        _fsync_dir(self._conversations_dir)
+
+        snapshot_path = os.path.join(self.journal_dir, SNAPSHOT_FILE)
+        tmp_path = snapshot_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(_dumps({'last_seq': last_seq}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+        _fsync_dir(self.journal_dir)
+
+        for path in self._segment_paths():
+            if _segment_first_seq(path) <= last_seq:
+                os.remove(path)
+
+def _fsync_dir(path: str):
+    """Make file creations, renames and removals in ``path`` durable"""
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _truncate_damaged(path: str, good_offset: int):
+    """Cut a file back to its last good record so later appends never merge with the damage"""
+    with open(path, 'r+b') as f:
+        f.seek(good_offset)
+        rest = f.read()
+        if b'\n' in rest:
+            # Complete lines failed their checksum or shape check; keep them for inspection
+            with open(path + ".corrupt", 'wb') as corrupt:
+                corrupt.write(rest)
+        f.truncate(good_offset)
+        os.fsync(f.fileno())
+
+def _segment_first_seq(path: str) -> int:
+    return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, separators=(',', ':'), default=_json_default)
+
+def _encode_record(record: Dict) -> str:
+    """Serialize a record as one line prefixed with the CRC32 of its JSON"""
+    payload = _dumps(record)
+    return f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n"
+
+def _decode_record(line: bytes) -> Optional[Dict]:
+    """Parse one journal line, returning None if it is torn, damaged or not a turn record"""
+    if not line.endswith(b'\n'):
+        return None
+    checksum, _, payload = line[:-1].partition(b' ')
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        record = json.loads(payload)
+        _check_record(record)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return record
+
+def _check_record(record: Dict):
+    """Raise if a parsed line does not have the shape record_turn() writes"""
+    for key, kind in (('seq', int), ('customer_id', str), ('message', str), ('response', str),
+                      ('persona', dict), ('technical_complexity', int),
+                      ('sentiment_score', (int, float))):
+        if not isinstance(record[key], kind):
+            raise TypeError(f"Journal record field {key!r} has the wrong type")
+    PersonaType(record['persona']['type'])
+    EscalationLevel(record['escalation_level'])
+
+def _json_default(value: Any) -> Any:
+    """Convert numpy scalars and enums that end up in persona characteristics"""
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _enum_value(value: Any) -> str:
+    return value.value if isinstance(value, Enum) else value
+
+def _persona_to_dict(persona: CustomerPersona) -> Dict:
+    return {
+        'type': _enum_value(persona.persona_type),
+        'confidence': persona.confidence,
+        'characteristics': persona.characteristics
+    }
+
+def _persona_from_dict(data: Dict) -> CustomerPersona:
+    return CustomerPersona(
+        persona_type=PersonaType(data['type']),
+        confidence=data['confidence'],
+        characteristics=data['characteristics']
+    )
+
+def _apply_record(contexts: Dict[str, ConversationContext], record: Dict):
+    """Replay a single journaled turn onto the recovered state"""
+    customer_id = record['customer_id']
+    context = contexts.get(customer_id)
+    if context is None:
+        context = ConversationContext(
+            customer_id=customer_id,
+            messages=[],
+            detected_persona=None,
+            escalation_level=EscalationLevel.NONE,
+            technical_complexity=1,
+            sentiment_score=0.0
+        )
+        contexts[customer_id] = context
+
+    context.messages.append({'role': 'customer', 'content': record['message']})
+    context.messages.append({'role': 'agent', 'content': record['response']})
+    context.detected_persona = _persona_from_dict(record['persona'])
+    context.escalation_level = EscalationLevel(record['escalation_level'])
+    context.technical_complexity = record['technical_complexity']
+    context.sentiment_score = record['sentiment_score']
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zlib
+from unittest import mock
+
+from src.conversation_journal import ConversationJournal, _encode_record
+from src.models import ConversationContext, CustomerPersona, PersonaType, EscalationLevel
+
+def make_record(seq: int, customer_id: str = "cust_1", level: str = "none",
+                persona: str = "general", complexity: int = 1) -> dict:
+    return {
+        'seq': seq,
+        'customer_id': customer_id,
+        'message': f"message {seq}",
+        'response': f"response {seq}",
+        'persona': {'type': persona, 'confidence': 0.5, 'characteristics': {}},
+        'escalation_level': level,
+        'escalation_reason': None,
+        'technical_complexity': complexity,
+        'sentiment_score': 0.0
+    }
+
+def make_context(customer_id: str = "cust_1") -> ConversationContext:
+    return ConversationContext(
+        customer_id=customer_id,
+        messages=[],
+        detected_persona=CustomerPersona(PersonaType.GENERAL, 0.5, {}),
+        escalation_level=EscalationLevel.NONE,
+        technical_complexity=1,
+        sentiment_score=0.0
+    )
+
+class ConversationJournalRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp(prefix="journal-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def write_segment(self, first_seq: int, records: list, tail: str = "") -> str:
+        path = os.path.join(self.journal_dir, f"journal-{first_seq:020d}.jsonl")
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(_encode_record(record))
+            f.write(tail)
+        return path
+
+    def write_conversation_log(self, records: list, tail: str = "") -> str:
+        name = hashlib.sha1(records[0]['customer_id'].encode('utf-8')).hexdigest() + ".jsonl"
+        path = os.path.join(self.journal_dir, "conversations", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(_encode_record(record))
+            f.write(tail)
+        return path
+
+    def write_snapshot(self, last_seq: int):
+        with open(os.path.join(self.journal_dir, "snapshot.json"), 'w') as f:
+            json.dump({'last_seq': last_seq}, f)
+
+    def checkpoint(self, last_seq: int):
+        """Lay out a completed checkpoint of turns 1..last_seq for cust_1"""
+        self.write_conversation_log([
+            make_record(seq, level='tier_2', persona='technical_expert', complexity=4)
+            for seq in range(1, last_seq + 1)
+        ])
+        self.write_snapshot(last_seq)
+
+    def recover(self, **kwargs):
+        journal = ConversationJournal(self.journal_dir, **kwargs)
+        contexts = journal.recover()
+        return journal, contexts
+
+    def segment_names(self) -> list:
+        return sorted(name for name in os.listdir(self.journal_dir) if name.startswith("journal-"))
+
+    def test_recover_empty_directory(self):
+        journal, contexts = self.recover()
+        journal.close()
+        self.assertEqual(contexts, {})
+
+    def test_recover_without_snapshot_replays_segments(self):
+        self.write_segment(1, [make_record(1), make_record(2, level='tier_1')])
+        self.write_segment(3, [make_record(3, customer_id="cust_2")])
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        self.assertEqual(len(contexts["cust_1"].messages), 4)
+        self.assertEqual(contexts["cust_1"].messages[-1], {'role': 'agent', 'content': "response 2"})
+        self.assertEqual(contexts["cust_1"].escalation_level, EscalationLevel.TIER_1)
+        self.assertEqual(contexts["cust_1"].detected_persona.persona_type, PersonaType.GENERAL)
+        self.assertEqual(len(contexts["cust_2"].messages), 2)
+
+    def test_records_covered_by_snapshot_are_not_replayed_twice(self):
+        self.checkpoint(2)
+        self.write_segment(1, [make_record(1), make_record(2), make_record(3)])
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        # Two checkpointed turns plus one replayed turn (seq 3)
+        self.assertEqual(len(contexts["cust_1"].messages), 6)
+        self.assertEqual(contexts["cust_1"].messages[-2]['content'], "message 3")
+
+    def test_interrupted_checkpoint_is_not_replayed_twice(self):
+        # The conversation log got seqs 1-3 but the crash came before snapshot.json moved on
+        self.write_conversation_log([make_record(1), make_record(2), make_record(3)])
+        self.write_segment(1, [make_record(seq) for seq in range(1, 5)])
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        self.assertEqual(
+            [m['content'] for m in contexts["cust_1"].messages if m['role'] == 'customer'],
+            [f"message {seq}" for seq in range(1, 5)]
+        )
+
+    def test_torn_conversation_log_is_completed_from_segments(self):
+        self.write_conversation_log([make_record(1)], tail=_encode_record(make_record(2))[:20])
+        self.write_segment(1, [make_record(1), make_record(2)])
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        self.assertEqual(len(contexts["cust_1"].messages), 4)
+
+    def test_snapshot_state_is_restored(self):
+        self.checkpoint(2)
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        context = contexts["cust_1"]
+        self.assertEqual(context.escalation_level, EscalationLevel.TIER_2)
+        self.assertEqual(context.detected_persona.persona_type, PersonaType.TECHNICAL_EXPERT)
+        self.assertEqual(context.technical_complexity, 4)
+
+    def test_turns_written_after_torn_tail_survive_restart(self):
+        self.checkpoint(2)
+        path = self.write_segment(3, [make_record(3), make_record(4)], tail='{"seq": 5, "cust')
+
+        journal, contexts = self.recover()
+        with open(path, 'rb') as f:
+            self.assertTrue(f.read().endswith(b'\n'))
+        context = contexts["cust_1"]
+        for i in range(5):
+            context.messages.append({'role': 'customer', 'content': f"new {i}"})
+            context.messages.append({'role': 'agent', 'content': f"reply {i}"})
+            journal.record_turn(context, f"new {i}", f"reply {i}")
+        journal.close()
+
+        journal, recovered = self.recover()
+        journal.close()
+        self.assertEqual(recovered["cust_1"].messages, context.messages)
+        self.assertEqual(len(recovered["cust_1"].messages), 18)
+
+    def test_torn_first_record_leaves_no_segment_behind(self):
+        self.write_segment(1, [], tail='{"seq": 1')
+
+        journal, contexts = self.recover()
+        journal.record_turn(make_context(), "hello", "hi")
+        journal.close()
+
+        journal, contexts = self.recover()
+        journal.close()
+        self.assertEqual(len(contexts["cust_1"].messages), 2)
+
+    def test_segments_after_a_tear_are_set_aside(self):
+        self.write_segment(1, [make_record(1)], tail='{"seq": 2')
+        self.write_segment(3, [make_record(3)])
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        self.assertEqual(len(contexts["cust_1"].messages), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.journal_dir, f"journal-{3:020d}.jsonl.corrupt")))
+
+    def test_checksum_mismatch_stops_replay_and_keeps_the_damage(self):
+        damaged = _encode_record(make_record(2)).replace("message 2", "message X")
+        path = self.write_segment(1, [make_record(1)], tail=damaged + _encode_record(make_record(3)))
+
+        journal, contexts = self.recover()
+        journal.close()
+
+        self.assertEqual(len(contexts["cust_1"].messages), 2)
+        with open(path + ".corrupt") as f:
+            self.assertIn("message X", f.read())
+
+    def test_well_formed_json_that_is_not_a_record_counts_as_damage(self):
+        for payload in ('{}', '5', '{"seq": 2, "customer_id": 7}'):
+            with self.subTest(payload=payload):
+                shutil.rmtree(self.journal_dir)
+                os.makedirs(self.journal_dir)
+                line = f"{zlib.crc32(payload.encode()):08x} {payload}\n"
+                self.write_segment(1, [make_record(1)], tail=line)
+
+                journal, contexts = self.recover()
+                journal.close()
+
+                self.assertEqual(len(contexts["cust_1"].messages), 2)
+
+    def test_snapshot_compacts_covered_segments(self):
+        journal, contexts = self.recover(snapshot_every=3)
+        context = make_context()
+        for i in range(7):
+            journal.record_turn(context, f"message {i}", f"response {i}")
+            journal.maybe_snapshot()
+        journal.close()
+
+        # Two snapshots were taken (after turns 3 and 6); only the segment starting at 7 remains
+        self.assertEqual(self.segment_names(), [f"journal-{7:020d}.jsonl"])
+        with open(os.path.join(self.journal_dir, "snapshot.json")) as f:
+            self.assertEqual(json.load(f)['last_seq'], 6)
+        self.assertEqual(len(os.listdir(os.path.join(self.journal_dir, "conversations"))), 1)
+
+        journal, recovered = self.recover()
+        journal.close()
+        self.assertEqual(len(recovered["cust_1"].messages), 14)
+
+    def test_record_turn_during_checkpoint_is_not_compacted_away(self):
+        journal, contexts = self.recover()
+        context = make_context()
+        started, release = threading.Event(), threading.Event()
+        write_snapshot = ConversationJournal._write_snapshot
+
+        def blocking_write_snapshot(journal, *args):
+            started.set()
+            release.wait(5)
+            write_snapshot(journal, *args)
+
+        with mock.patch.object(ConversationJournal, '_write_snapshot', autospec=True,
+                               side_effect=blocking_write_snapshot):
+            for i in range(1, 4):
+                journal.record_turn(context, f"message {i}", f"response {i}")
+            journal.snapshot()
+            self.assertTrue(started.wait(5))
+            # These land while the checkpoint of turns 1-3 is still in flight
+            for i in range(4, 6):
+                journal.record_turn(context, f"message {i}", f"response {i}")
+            release.set()
+            journal.close()
+
+        with open(os.path.join(self.journal_dir, "snapshot.json")) as f:
+            self.assertEqual(json.load(f)['last_seq'], 3)
+        self.assertEqual(self.segment_names(), [f"journal-{4:020d}.jsonl"])
+
+        journal, recovered = self.recover()
+        journal.close()
+        self.assertEqual(
+            [m['content'] for m in recovered["cust_1"].messages if m['role'] == 'customer'],
+            [f"message {i}" for i in range(1, 6)]
+        )
+
+    def test_new_segment_directory_entry_is_synced(self):
+        self.checkpoint(2)
+
+        with mock.patch('src.conversation_journal._fsync_dir') as fsync_dir:
+            journal, contexts = self.recover()
+            journal.record_turn(contexts["cust_1"], "hello", "hi")
+            journal.close()
+
+        fsync_dir.assert_called_with(self.journal_dir)
+
+class ConversationJournalErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp(prefix="journal-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def test_background_fsync_error_is_raised_by_close(self):
+        journal = ConversationJournal(self.journal_dir, commit_interval=0.01)
+        journal.recover()
+
+        with mock.patch('src.conversation_journal.os.fsync', side_effect=OSError(28, "No space left on device")):
+            journal.record_turn(make_context(), "hello", "hi")
+            with self.assertRaises(RuntimeError):
+                journal.close()
+
+    def test_fsync_failure_fails_the_journal_for_good(self):
+        journal = ConversationJournal(self.journal_dir, commit_interval=0.01)
+        journal.recover()
+        context = make_context()
+
+        failed = threading.Event()
+
+        def failing_fsync(fd):
+            failed.set()
+            raise OSError(5, "Input/output error")
+
+        with mock.patch('src.conversation_journal.os.fsync', side_effect=failing_fsync):
+            journal.record_turn(context, "hello", "hi")
+            self.assertTrue(failed.wait(5))
+            # The flusher records the error and stops, so joining it is enough to observe the failure
+            journal._flusher.join(5)
+            self.assertFalse(journal._flusher.is_alive())
+
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                journal.record_turn(context, "again", "reply")
+        with self.assertRaises(RuntimeError):
+            journal.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import CustomerServiceAgent
+from src.conversation_journal import ConversationJournal
+from src.models import CustomerPersona, PersonaType, EscalationLevel
+
+def detect_persona(message, history):
+    """Stand-in for the sentiment model: 'angry' messages read as highly frustrated"""
+    if 'angry' in message:
+        return CustomerPersona(PersonaType.FRUSTRATED_USER, 0.9,
+                               {'sentiment_score': -0.9, 'technical_score': 0.2})
+    return CustomerPersona(PersonaType.GENERAL, 0.6,
+                           {'sentiment_score': 0.5, 'technical_score': 0.2})
+
+class CustomerServiceAgentPersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp(prefix="agent-journal-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def make_agent(self) -> CustomerServiceAgent:
+        # Stub the model-backed components; escalation and journaling stay real
+        with mock.patch('src.PersonaDetector') as persona_detector, \
+                mock.patch('src.KnowledgeBase') as knowledge_base, \
+                mock.patch('src.ResponseGenerator') as response_generator:
+            persona_detector.return_value.detect_persona.side_effect = detect_persona
+            knowledge_base.return_value.search_articles.return_value = []
+            response_generator.return_value.generate_response.side_effect = \
+                lambda message, persona, articles, needs_escalation: f"reply to {message}"
+            return CustomerServiceAgent(journal_dir=self.journal_dir)
+
+    def test_restarted_agent_keeps_history_and_escalation(self):
+        agent = self.make_agent()
+        agent.process_message("cust_1", "hello")
+        result = agent.process_message("cust_1", "I am angry")
+        history = list(agent.get_conversation_history("cust_1"))
+        agent.close()
+        self.assertEqual(result['escalation']['level'], 'manager')
+
+        restarted = self.make_agent()
+        restarted.close()
+
+        self.assertEqual(restarted.get_conversation_history("cust_1"), history)
+        context = restarted.conversation_contexts["cust_1"]
+        self.assertEqual(context.escalation_level, EscalationLevel.MANAGER)
+        self.assertEqual(context.detected_persona.persona_type, PersonaType.FRUSTRATED_USER)
+
+    def test_new_conversation_with_string_defaults_round_trips(self):
+        agent = self.make_agent()
+        agent.process_message("cust_1", "hello")
+        # A conversation that never escalated still carries the string default
+        self.assertEqual(agent.conversation_contexts["cust_1"].escalation_level, 'none')
+        agent.close()
+
+        restarted = self.make_agent()
+        restarted.close()
+
+        context = restarted.conversation_contexts["cust_1"]
+        self.assertEqual(context.escalation_level, EscalationLevel.NONE)
+        self.assertEqual(context.detected_persona.persona_type, PersonaType.GENERAL)
+        self.assertEqual(len(context.messages), 2)
+
+    def test_failed_journal_write_leaves_memory_untouched(self):
+        agent = self.make_agent()
+        agent.process_message("cust_1", "hello")
+        before = agent.conversation_contexts["cust_1"]
+        history = list(before.messages)
+
+        with mock.patch.object(ConversationJournal, 'record_turn',
+                               side_effect=RuntimeError("Conversation journal failed")):
+            with self.assertRaises(RuntimeError):
+                agent.process_message("cust_1", "I am angry")
+        agent.close()
+
+        context = agent.conversation_contexts["cust_1"]
+        self.assertIs(context, before)
+        self.assertEqual(context.messages, history)
+        self.assertEqual(context.escalation_level, 'none')
+
+if __name__ == "__main__":
+    unittest.main()